@@ -1,5 +1,10 @@
 import psycopg2
+import argparse
+import glob
+import math
 import os
+import re
+import sys
 from psycopg2 import sql
 
 
@@ -43,6 +48,683 @@ class ConnectionManager:
         self.connection.close()
 
 
+def detect_host_resources():
+    """
+    Returns the CPU cores, memory (MB) and storage type (ssd/hdd) of the Postgres host,
+    read from the POSTGRES_TUNE_CPU_CORES, POSTGRES_TUNE_MEMORY_MB and
+    POSTGRES_TUNE_STORAGE_TYPE environment variables. Values which are not set are only
+    detected when POSTGRES_HOST is local and the script runs on Linux, as anywhere else
+    (Windows, Docker Desktop's VM, a remote server) this host is not the Postgres host
+    """
+    can_detect = (
+        os.environ.get("POSTGRES_HOST") in ("localhost", "127.0.0.1", "::1")
+        and sys.platform.startswith("linux")
+        and hasattr(os, "sysconf")
+    )
+    resources = {}
+    sources = {}
+    missing = []
+
+    cpu_cores = os.environ.get("POSTGRES_TUNE_CPU_CORES")
+    if cpu_cores:
+        resources["cpu_cores"], sources["cpu_cores"] = int(cpu_cores), "config"
+    elif can_detect:
+        resources["cpu_cores"], sources["cpu_cores"] = os.cpu_count() or 1, "detected"
+    else:
+        missing.append("POSTGRES_TUNE_CPU_CORES")
+
+    memory_mb = os.environ.get("POSTGRES_TUNE_MEMORY_MB")
+    if memory_mb:
+        resources["memory_mb"], sources["memory_mb"] = int(memory_mb), "config"
+    elif can_detect:
+        resources["memory_mb"] = (
+            os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+        )
+        sources["memory_mb"] = "detected"
+    else:
+        missing.append("POSTGRES_TUNE_MEMORY_MB")
+
+    if missing:
+        raise Exception(
+            f"Cannot detect the resources of Postgres host '{os.environ.get('POSTGRES_HOST')}' "
+            f"from this machine, set {', '.join(missing)} to tune the server"
+        )
+
+    storage_type = os.environ.get("POSTGRES_TUNE_STORAGE_TYPE", "").lower()
+    if storage_type in ("ssd", "hdd"):
+        sources["storage_type"] = "config"
+    elif can_detect:
+        # A disk is rotational (hdd) if the kernel flags it as such, default to ssd
+        storage_type = "ssd"
+        rotational_flags = []
+        for path in glob.glob("/sys/block/*/queue/rotational"):
+            if "/loop" in path or "/ram" in path:
+                continue
+            with open(path) as f:
+                rotational_flags.append(f.read().strip())
+        if rotational_flags and all(flag == "1" for flag in rotational_flags):
+            storage_type = "hdd"
+        sources["storage_type"] = "detected"
+    else:
+        # Assuming ssd only lowers random_page_cost and raises effective_io_concurrency
+        storage_type = "ssd"
+        sources["storage_type"] = "default"
+    resources["storage_type"] = storage_type
+
+    for name, value in resources.items():
+        print(f"Postgres host {name}: {value} ({sources[name]})")
+    return resources
+
+
+def recommend_settings(cpu_cores, memory_mb, storage_type, max_connections):
+    """
+    Returns the recommended Postgres server parameters for the given host resources
+    """
+    shared_buffers_mb = max(memory_mb // 4, 128)
+    parallel_workers_per_gather = min(max(math.ceil(cpu_cores / 2), 1), 4)
+    # Leave room for a few sorts/hashes per connection and per parallel worker
+    work_mem_kb = max(
+        (memory_mb - shared_buffers_mb)
+        * 1024
+        // (max_connections * 3)
+        // parallel_workers_per_gather,
+        4096,
+    )
+    wal_buffers_kb = min(max(shared_buffers_mb * 1024 * 3 // 100, 64), 16384) // 8 * 8
+
+    settings = {
+        "shared_buffers": f"{shared_buffers_mb}MB",
+        "effective_cache_size": f"{memory_mb * 3 // 4}MB",
+        "maintenance_work_mem": f"{min(memory_mb // 16, 2048)}MB",
+        "work_mem": f"{work_mem_kb}kB",
+        "wal_buffers": f"{wal_buffers_kb}kB",
+        "checkpoint_completion_target": "0.9",
+        "min_wal_size": "1GB",
+        "max_wal_size": "4GB",
+        "default_statistics_target": "100",
+        "random_page_cost": "1.1" if storage_type == "ssd" else "4",
+        "effective_io_concurrency": "200" if storage_type == "ssd" else "2",
+        "max_worker_processes": str(max(cpu_cores, 8)),
+        "max_parallel_workers": str(cpu_cores),
+        "max_parallel_workers_per_gather": str(parallel_workers_per_gather),
+        "max_parallel_maintenance_workers": str(parallel_workers_per_gather),
+    }
+    return settings
+
+
+def _normalize_setting(value):
+    """
+    Normalizes a setting value so that e.g. '1GB' and '1024MB' compare as equal
+    """
+    units = {"kb": 1, "mb": 1024, "gb": 1024 * 1024, "tb": 1024 * 1024 * 1024}
+    value = str(value).strip().lower()
+    for unit, multiplier in units.items():
+        if value.endswith(unit) and value[: -len(unit)].strip().isdigit():
+            return int(value[: -len(unit)]) * multiplier
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def tune_postgres_server(cur):
+    """
+    Applies recommended server parameters via ALTER SYSTEM based on the host resources.
+    Returns the before/after diff split into settings applied by a reload and settings
+    which only take effect after a server restart
+    """
+    resources = detect_host_resources()
+    cur.execute(sql.SQL("SELECT current_setting('max_connections')::int"))
+    max_connections = int(
+        os.environ.get("POSTGRES_TUNE_MAX_CONNECTIONS", cur.fetchone()[0])
+    )
+    print(
+        f"Tuning Postgres for {resources['cpu_cores']} CPU cores, {resources['memory_mb']}MB memory, "
+        f"{resources['storage_type']} storage and {max_connections} max connections..."
+    )
+    recommended = recommend_settings(max_connections=max_connections, **resources)
+
+    result = {"resources": resources, "reload": {}, "restart": {}, "unchanged": []}
+    for name, value in recommended.items():
+        cur.execute(
+            sql.SQL(
+                "SELECT current_setting(%s), context FROM pg_settings WHERE name = %s"
+            ),
+            (name, name),
+        )
+        before, context = cur.fetchone()
+        if _normalize_setting(before) == _normalize_setting(value):
+            result["unchanged"].append(name)
+            continue
+        cur.execute(
+            sql.SQL("ALTER SYSTEM SET {} = {}").format(
+                sql.Identifier(name), sql.Literal(value)
+            )
+        )
+        # Settings with the postmaster context are only read at server start
+        group = "restart" if context == "postmaster" else "reload"
+        result[group][name] = {"before": before, "after": value}
+
+    if result["reload"] or result["restart"]:
+        cur.execute(sql.SQL("SELECT pg_reload_conf()"))
+
+    for name, diff in result["reload"].items():
+        print(
+            f"Setting {name}: {diff['before']} -> {diff['after']} (applied by reload)"
+        )
+    for name, diff in result["restart"].items():
+        print(f"Setting {name}: {diff['before']} -> {diff['after']} (requires restart)")
+    if result["unchanged"]:
+        print(f"Settings already tuned, skipping: {', '.join(result['unchanged'])}")
+    if result["restart"]:
+        print("Restart the Postgres server to apply the pending settings")
+
+    return result
+
+
+def install_todo_cache_triggers(cur, schema, table, channel):
+    """
+    Installs the triggers which NOTIFY the todo list cache listeners with the user id
+    whose todo list changed on insert, update or delete (and '*' on truncate)
+    """
+    # Check if the todo table exists
+    cur.execute(
+        sql.SQL("SELECT to_regclass(%s)"),
+        (sql.Identifier(schema, table).as_string(cur),),
+    )
+    if cur.fetchone()[0] is None:
+        print(f"Table {schema}.{table} does not exist, skipping cache triggers...")
+        return
+
+    print(f"Installing cache invalidation triggers on {schema}.{table}...")
+    query_list = [
+        sql.SQL("""
+            CREATE OR REPLACE FUNCTION {}.notify_todo_change() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM pg_notify({}, OLD.user_id::text);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM pg_notify({}, NEW.user_id::text);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """).format(
+            sql.Identifier(schema), sql.Literal(channel), sql.Literal(channel)
+        ),
+        sql.SQL("""
+            CREATE OR REPLACE FUNCTION {}.notify_todo_truncate() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify({}, '*');
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """).format(sql.Identifier(schema), sql.Literal(channel)),
+        sql.SQL(
+            "CREATE OR REPLACE TRIGGER todo_cache_invalidate "
+            "AFTER INSERT OR UPDATE OR DELETE ON {} "
+            "FOR EACH ROW EXECUTE FUNCTION {}.notify_todo_change()"
+        ).format(sql.Identifier(schema, table), sql.Identifier(schema)),
+        sql.SQL(
+            "CREATE OR REPLACE TRIGGER todo_cache_invalidate_truncate "
+            "AFTER TRUNCATE ON {} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION {}.notify_todo_truncate()"
+        ).format(sql.Identifier(schema, table), sql.Identifier(schema)),
+    ]
+    for query in query_list:
+        cur.execute(query)
+
+
+def _partition_name(table, modulus, remainder):
+    """
+    Returns the name of the hash partition of the table for the given bounds
+    """
+    return f"{table}_m{modulus}_r{remainder}"
+
+
+def create_todo_tables(cur, schema, table, partition_count=0):
+    """
+    Creates the todo table in the app schema, hash-partitioned by user id when
+    partition_count is greater than zero. Indexes created on the parent table are
+    created locally on every partition
+    """
+    # Check if the todo table exists
+    cur.execute(
+        sql.SQL("SELECT to_regclass(%s)"),
+        (sql.Identifier(schema, table).as_string(cur),),
+    )
+    if cur.fetchone()[0] is not None:
+        print(f"Table {schema}.{table} already exists, skipping...")
+        return
+
+    print(f"Table {schema}.{table} does not exist, creating...")
+    query_list = [
+        sql.SQL("""
+            CREATE TABLE {} (
+                id BIGINT GENERATED ALWAYS AS IDENTITY,
+                user_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                notes TEXT,
+                completed BOOLEAN NOT NULL DEFAULT FALSE,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (user_id, id)
+            ) {}
+            """).format(
+            sql.Identifier(schema, table),
+            (
+                sql.SQL("PARTITION BY HASH (user_id)")
+                if partition_count > 0
+                else sql.SQL("")
+            ),
+        )
+    ]
+    for remainder in range(partition_count):
+        query_list.append(
+            sql.SQL(
+                "CREATE TABLE {} PARTITION OF {} FOR VALUES WITH (MODULUS {}, REMAINDER {})"
+            ).format(
+                sql.Identifier(
+                    schema, _partition_name(table, partition_count, remainder)
+                ),
+                sql.Identifier(schema, table),
+                sql.Literal(partition_count),
+                sql.Literal(remainder),
+            )
+        )
+    query_list.append(
+        sql.SQL("CREATE INDEX {} ON {} (user_id, completed, created_at)").format(
+            sql.Identifier(f"{table}_user_completed_idx"),
+            sql.Identifier(schema, table),
+        )
+    )
+    for query in query_list:
+        cur.execute(query)
+    if partition_count > 0:
+        print(f"Table {schema}.{table} created with {partition_count} hash partitions")
+
+
+def get_todo_partitions(cur, schema, table):
+    """
+    Returns the hash partitions of the todo table as (name, modulus, remainder) tuples
+    """
+    cur.execute(
+        sql.SQL("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname
+            """),
+        (sql.Identifier(schema, table).as_string(cur),),
+    )
+    partitions = []
+    for name, bound in cur.fetchall():
+        match = re.search(r"modulus (\d+), remainder (\d+)", bound)
+        if match is None:
+            raise Exception(f"Partition {name} is not a hash partition: {bound}")
+        partitions.append((name, int(match.group(1)), int(match.group(2))))
+    return partitions
+
+
+def _hash_bound_check(cur, schema, table, modulus, remainder):
+    """
+    Returns the check that user_id belongs to the given hash partition bound of the table
+    """
+    return sql.SQL(
+        "satisfies_hash_partition({}::regclass::oid, {}, {}, user_id)"
+    ).format(
+        sql.Literal(sql.Identifier(schema, table).as_string(cur)),
+        sql.Literal(modulus),
+        sql.Literal(remainder),
+    )
+
+
+def _attach_skips_scan(cur, schema, table, modulus, remainder):
+    """
+    Returns whether ATTACH PARTITION accepts a bound check constraint like the one on the
+    new partitions as proof of the partition constraint, instead of scanning the table.
+    Attaches a constraint-only table to an empty copy of the todo table with debug
+    messages enabled and rolls it all back. Runs in the transaction of the cursor
+    """
+    connection = cur.connection
+    probe = f"{table}_split_probe"
+    try:
+        cur.execute(
+            sql.SQL("CREATE TABLE {} (LIKE {}) PARTITION BY HASH (user_id)").format(
+                sql.Identifier(schema, probe), sql.Identifier(schema, table)
+            )
+        )
+        cur.execute(
+            sql.SQL("CREATE TABLE {} (LIKE {}, CHECK ({}))").format(
+                sql.Identifier(schema, f"{probe}_part"),
+                sql.Identifier(schema, table),
+                _hash_bound_check(cur, schema, probe, modulus, remainder),
+            )
+        )
+        cur.execute("SET LOCAL client_min_messages = debug1")
+        del connection.notices[:]
+        cur.execute(
+            sql.SQL(
+                "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES WITH (MODULUS {}, REMAINDER {})"
+            ).format(
+                sql.Identifier(schema, probe),
+                sql.Identifier(schema, f"{probe}_part"),
+                sql.Literal(modulus),
+                sql.Literal(remainder),
+            )
+        )
+        return any(
+            "is implied by existing constraints" in notice
+            for notice in connection.notices
+        )
+    finally:
+        connection.rollback()
+
+
+def _apply_todo_split_log(cur, schema, table, partition, new_partitions):
+    """
+    Re-copies the rows of the partition which changed since they were copied into the new
+    partitions and removes them from the split log. Returns the number of log entries
+    applied. Runs in the transaction of the cursor
+    """
+    split_log = sql.Identifier(schema, f"{table}_split_log")
+    cur.execute(
+        sql.SQL("SELECT max(log_id) FROM {} WHERE partition = %s").format(split_log),
+        (partition,),
+    )
+    upto = cur.fetchone()[0]
+    if upto is None:
+        return 0
+
+    changed_keys = sql.SQL(
+        "SELECT user_id, id FROM {} WHERE partition = %s AND log_id <= %s"
+    ).format(split_log)
+    for new_partition, new_modulus, new_remainder in new_partitions:
+        cur.execute(
+            sql.SQL("DELETE FROM {} WHERE (user_id, id) IN ({})").format(
+                sql.Identifier(schema, new_partition), changed_keys
+            ),
+            (partition, upto),
+        )
+        cur.execute(
+            sql.SQL(
+                "INSERT INTO {} SELECT * FROM {} WHERE (user_id, id) IN ({}) AND {}"
+            ).format(
+                sql.Identifier(schema, new_partition),
+                sql.Identifier(schema, partition),
+                changed_keys,
+                _hash_bound_check(cur, schema, table, new_modulus, new_remainder),
+            ),
+            (partition, upto),
+        )
+    cur.execute(
+        sql.SQL("DELETE FROM {} WHERE partition = %s AND log_id <= %s").format(
+            split_log
+        ),
+        (partition, upto),
+    )
+    return cur.rowcount
+
+
+def _copy_todo_partition(cur, schema, table, partition, new_partitions, batch_size):
+    """
+    Copies the rows of the partition into the new partitions in batches of batch_size
+    keys, committing after each batch so that no long transaction holds back vacuum
+    """
+    connection = cur.connection
+    copied = 0
+    last_key = None
+    while True:
+        after = sql.SQL("(user_id, id) > (%s, %s)") if last_key else sql.SQL("TRUE")
+        # The primary key index walks the partition one key range at a time
+        cur.execute(
+            sql.SQL(
+                "SELECT user_id, id FROM {} WHERE {} ORDER BY user_id, id OFFSET %s LIMIT 1"
+            ).format(sql.Identifier(schema, partition), after),
+            (*(last_key or ()), batch_size - 1),
+        )
+        upto_key = cur.fetchone()
+        upto = sql.SQL("(user_id, id) <= (%s, %s)") if upto_key else sql.SQL("TRUE")
+        for new_partition, new_modulus, new_remainder in new_partitions:
+            cur.execute(
+                sql.SQL(
+                    "INSERT INTO {} SELECT * FROM {} WHERE {} AND {} AND {}"
+                ).format(
+                    sql.Identifier(schema, new_partition),
+                    sql.Identifier(schema, partition),
+                    after,
+                    upto,
+                    _hash_bound_check(cur, schema, table, new_modulus, new_remainder),
+                ),
+                (*(last_key or ()), *(upto_key or ())),
+            )
+            copied += cur.rowcount
+        connection.commit()
+        if upto_key is None:
+            return copied
+        last_key = upto_key
+
+
+def _drop_todo_split(cur, schema, table, partition, new_partitions):
+    """
+    Removes what an unfinished split of the partition left behind: the split log trigger
+    and entries, and the new tables. The cursor must have autocommit enabled
+    """
+    query_list = [
+        sql.SQL("DROP TRIGGER IF EXISTS todo_split_log ON {}").format(
+            sql.Identifier(schema, partition)
+        ),
+        sql.SQL("DELETE FROM {} WHERE partition = {}").format(
+            sql.Identifier(schema, f"{table}_split_log"), sql.Literal(partition)
+        ),
+    ]
+    for new_partition, _, _ in new_partitions:
+        query_list.append(
+            sql.SQL("DROP TABLE IF EXISTS {}").format(
+                sql.Identifier(schema, new_partition)
+            )
+        )
+    for query in query_list:
+        cur.execute(query)
+
+
+def split_todo_partition(
+    cur,
+    schema,
+    table,
+    partition,
+    lock_timeout="5s",
+    swap_attempts=5,
+    batch_size=10000,
+    allow_locked_scan=False,
+):
+    """
+    Splits a hash partition of the todo table into two partitions with double the
+    modulus, online:
+    1. a trigger logs the keys of the rows changed in the partition
+    2. the rows are copied into the new tables in committed batches of batch_size keys,
+       without blocking readers or writers
+    3. the logged changes are re-copied, still without blocking
+    4. the todo table is locked exclusively (blocking readers and writers of every
+       partition) only to apply the last logged changes and swap the partitions
+    The lock waits at most lock_timeout and the swap is retried swap_attempts times.
+    The swap only stays short if ATTACH can skip scanning the new partitions, which is
+    checked on the server first; the split is refused otherwise unless allow_locked_scan.
+    When the split fails its trigger, log entries and new tables are removed, so the
+    split has to be run again from the start. The cursor must have autocommit enabled
+    """
+    partitions = {
+        name: (modulus, remainder)
+        for name, modulus, remainder in get_todo_partitions(cur, schema, table)
+    }
+    if partition not in partitions:
+        raise Exception(f"Partition {partition} does not exist on {schema}.{table}")
+    modulus, remainder = partitions[partition]
+    new_partitions = [
+        (_partition_name(table, modulus * 2, new_remainder), modulus * 2, new_remainder)
+        for new_remainder in (remainder, remainder + modulus)
+    ]
+    new_partition_names = ", ".join(name for name, _, _ in new_partitions)
+    print(f"Splitting partition {partition} into {new_partition_names}...")
+    split_log = sql.Identifier(schema, f"{table}_split_log")
+
+    connection = cur.connection
+    connection.autocommit = False
+    try:
+        skips_scan = _attach_skips_scan(cur, schema, table, modulus * 2, remainder)
+    finally:
+        connection.autocommit = True
+    if not skips_scan:
+        if not allow_locked_scan:
+            raise Exception(
+                f"Failed to split {partition}, ATTACH PARTITION would scan the new "
+                f"partitions while {schema}.{table} is locked exclusively. "
+                "Run the split with --allow-locked-scan to accept it"
+            )
+        print(
+            f"Warning: the new partitions are scanned while {schema}.{table} is locked"
+        )
+
+    # Log the keys of the rows changed in the partition from now on
+    query_list = [
+        sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {} ("
+            "log_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY, "
+            "partition TEXT NOT NULL, user_id TEXT NOT NULL, id BIGINT NOT NULL)"
+        ).format(split_log),
+        sql.SQL("""
+            CREATE OR REPLACE FUNCTION {}.todo_split_log() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO {} (partition, user_id, id)
+                    VALUES (TG_TABLE_NAME, OLD.user_id, OLD.id);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {} (partition, user_id, id)
+                    VALUES (TG_TABLE_NAME, NEW.user_id, NEW.id);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """).format(sql.Identifier(schema), split_log, split_log),
+        sql.SQL("DELETE FROM {} WHERE partition = {}").format(
+            split_log, sql.Literal(partition)
+        ),
+        sql.SQL(
+            "CREATE OR REPLACE TRIGGER todo_split_log "
+            "AFTER INSERT OR UPDATE OR DELETE ON {} "
+            "FOR EACH ROW EXECUTE FUNCTION {}.todo_split_log()"
+        ).format(sql.Identifier(schema, partition), sql.Identifier(schema)),
+    ]
+    for new_partition, new_modulus, new_remainder in new_partitions:
+        # The check constraint matches the partition bound so ATTACH can skip its scan
+        query_list.append(
+            sql.SQL("DROP TABLE IF EXISTS {}").format(
+                sql.Identifier(schema, new_partition)
+            )
+        )
+        query_list.append(
+            sql.SQL("""
+                CREATE TABLE {} (
+                    LIKE {} INCLUDING DEFAULTS INCLUDING INDEXES,
+                    CONSTRAINT {} CHECK ({})
+                )
+                """).format(
+                sql.Identifier(schema, new_partition),
+                sql.Identifier(schema, table),
+                sql.Identifier(f"{new_partition}_bound"),
+                _hash_bound_check(cur, schema, table, new_modulus, new_remainder),
+            )
+        )
+
+    try:
+        for query in query_list:
+            cur.execute(query)
+
+        connection.autocommit = False
+        # Copy the rows, every change made after a row was copied is in the split log
+        copied = _copy_todo_partition(
+            cur, schema, table, partition, new_partitions, batch_size
+        )
+        print(f"Copied {copied} rows from {partition}")
+
+        # Catch up with the changes made during the copy without blocking
+        while (
+            _apply_todo_split_log(cur, schema, table, partition, new_partitions) > 100
+        ):
+            connection.commit()
+        connection.commit()
+
+        for attempt in range(1, swap_attempts + 1):
+            try:
+                cur.execute(
+                    sql.SQL("SET LOCAL lock_timeout = {}").format(
+                        sql.Literal(lock_timeout)
+                    )
+                )
+                # Take the strongest lock first so the swap cannot deadlock with writers
+                cur.execute(
+                    sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(
+                        sql.Identifier(schema, table)
+                    )
+                )
+                _apply_todo_split_log(cur, schema, table, partition, new_partitions)
+                cur.execute(
+                    sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                        sql.Identifier(schema, table), sql.Identifier(schema, partition)
+                    )
+                )
+                for new_partition, new_modulus, new_remainder in new_partitions:
+                    cur.execute(
+                        sql.SQL(
+                            "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES WITH (MODULUS {}, REMAINDER {})"
+                        ).format(
+                            sql.Identifier(schema, table),
+                            sql.Identifier(schema, new_partition),
+                            sql.Literal(new_modulus),
+                            sql.Literal(new_remainder),
+                        )
+                    )
+                    cur.execute(
+                        sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+                            sql.Identifier(schema, new_partition),
+                            sql.Identifier(f"{new_partition}_bound"),
+                        )
+                    )
+                cur.execute(
+                    sql.SQL("DROP TABLE {}").format(sql.Identifier(schema, partition))
+                )
+                connection.commit()
+                break
+            except psycopg2.errors.LockNotAvailable:
+                connection.rollback()
+                print(
+                    f"Timed out locking {schema}.{table} to swap {partition} (attempt {attempt}/{swap_attempts})"
+                )
+        else:
+            raise Exception(
+                f"Failed to lock {schema}.{table} to swap {partition} after {swap_attempts} attempts"
+            )
+    except Exception:
+        connection.rollback()
+        connection.autocommit = True
+        # Without the cleanup the trigger would keep logging every change forever
+        try:
+            _drop_todo_split(cur, schema, table, partition, new_partitions)
+            print(f"Split of {partition} cleaned up, it has to be run again")
+        except psycopg2.Error as e:
+            print(
+                f"Error: failed to clean up the split of {partition}, drop the todo_split_log trigger on it: {e}"
+            )
+        raise
+    finally:
+        connection.autocommit = True
+
+    print(f"Partition {partition} split into {new_partition_names} successfully")
+    return [name for name, _, _ in new_partitions]
+
+
 def create_user_and_database():
     """
     Creates a new user, assigns roles and creates database with ownership to app user on the Postgres server
@@ -61,6 +743,11 @@ def create_user_and_database():
         app_user_password = os.environ["TODO_APP_DB_PASSWORD"]
         keycloak_schema = os.environ["KC_DB_SCHEMA"]
         app_schema = os.environ["TODO_APP_SCHEMA"]
+        app_table = os.environ.get("TODO_APP_TABLE", "todos")
+        app_partition_count = int(os.environ.get("TODO_APP_PARTITION_COUNT", "0"))
+        app_cache_channel = os.environ.get(
+            "TODO_APP_CACHE_CHANNEL", "todo_cache_invalidation"
+        )
 
         # Create a connection manager
         cm = ConnectionManager()
@@ -148,6 +835,9 @@ def create_user_and_database():
             else:
                 print(f"Schema {schema} already exists, skipping...")
 
+        create_todo_tables(app_cur, app_schema, app_table, app_partition_count)
+        install_todo_cache_triggers(app_cur, app_schema, app_table, app_cache_channel)
+
         # Close the cursor and connection
         cm.close_connection(app_cur)
 
@@ -156,5 +846,85 @@ def create_user_and_database():
         raise
 
 
+def tune_database_server():
+    """
+    Connects to the Postgres server as the admin user and applies the tuning stage
+    """
+    try:
+        cm = ConnectionManager()
+        cur = cm.get_cursor()
+        result = tune_postgres_server(cur)
+        cm.close_connection(cur)
+        return result
+
+    except psycopg2.Error as e:
+        print(f"Error: {e}")
+        raise
+
+
+def split_todo_partitions(partitions=None, allow_locked_scan=False):
+    """
+    Connects to the app database as the app user and splits the given todo partitions,
+    or every partition when none are given (doubling the partition count)
+    """
+    try:
+        app_schema = os.environ["TODO_APP_SCHEMA"]
+        app_table = os.environ.get("TODO_APP_TABLE", "todos")
+
+        cm = ConnectionManager()
+        app_cur = cm.get_cursor(
+            host=os.environ["TODO_APP_HOST"],
+            port=os.environ["TODO_APP_PORT"],
+            database=os.environ["TODO_APP_DB"],
+            user=os.environ["TODO_APP_DB_USER"],
+            password=os.environ["TODO_APP_DB_PASSWORD"],
+        )
+        if not partitions:
+            partitions = [
+                name
+                for name, _, _ in get_todo_partitions(app_cur, app_schema, app_table)
+            ]
+        # Each partition is split on its own, only its final swap blocks the table
+        for partition in partitions:
+            split_todo_partition(
+                app_cur,
+                app_schema,
+                app_table,
+                partition,
+                batch_size=int(os.environ.get("TODO_APP_SPLIT_BATCH_SIZE", "10000")),
+                allow_locked_scan=allow_locked_scan,
+            )
+        cm.close_connection(app_cur)
+
+    except psycopg2.Error as e:
+        print(f"Error: {e}")
+        raise
+
+
 if __name__ == "__main__":
-    create_user_and_database()
+    parser = argparse.ArgumentParser(description="Sets up the todo app database")
+    parser.add_argument(
+        "--split-partition",
+        action="append",
+        dest="split_partitions",
+        metavar="PARTITION",
+        help="split the todo table partition in two, can be repeated",
+    )
+    parser.add_argument(
+        "--split-all",
+        action="store_true",
+        help="split every todo table partition in two",
+    )
+    parser.add_argument(
+        "--allow-locked-scan",
+        action="store_true",
+        help="split even if the new partitions are scanned while the todo table is locked",
+    )
+    args = parser.parse_args()
+
+    if args.split_partitions or args.split_all:
+        split_todo_partitions(args.split_partitions, args.allow_locked_scan)
+    else:
+        create_user_and_database()
+        if os.environ.get("POSTGRES_TUNE_ENABLED", "false").lower() == "true":
+            tune_database_server()
@@ -1,5 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import requests
+import json
 import os
+import threading
+import time
+
+# User events which change a user as seen by the local user directory
+USER_DIRECTORY_EVENT_TYPES = [
+    "REGISTER",
+    "UPDATE_PROFILE",
+    "UPDATE_EMAIL",
+    "DELETE_ACCOUNT",
+]
 
 
 class KeycloakConfig:
@@ -7,9 +20,11 @@ class KeycloakConfig:
     Keycloak configuration class
     """
 
-    def __init__(self):
+    def __init__(self, realm_spec=None):
         """
-        Initializes the Keycloak configuration
+        Initializes the Keycloak configuration, the values of the realm spec (realm, client,
+        admin_group, admin_username, admin_password, admin_email, admin_events_enabled)
+        override the environment
         """
         self.keycloak_url = os.environ.get("KEYCLOAK_URL")
         self.keycloak_admin = os.environ.get("KC_BOOTSTRAP_ADMIN_USERNAME")
@@ -22,6 +37,78 @@ class KeycloakConfig:
         self.keycloak_app_admin_username = os.environ.get("KEYCLOAK_APP_ADMIN_USERNAME")
         self.keycloak_app_admin_password = os.environ.get("KEYCLOAK_APP_ADMIN_PASSWORD")
         self.keycloak_app_admin_email = os.environ.get("KEYCLOAK_APP_ADMIN_EMAIL")
+        self.keycloak_app_admin_events_enabled = (
+            os.environ.get("KEYCLOAK_APP_ADMIN_EVENTS_ENABLED", "false").lower()
+            == "true"
+        )
+        realm_spec = realm_spec or {}
+        self.keycloak_app_realm_name = realm_spec.get(
+            "realm", self.keycloak_app_realm_name
+        )
+        self.keycloak_app_client_name = realm_spec.get(
+            "client", self.keycloak_app_client_name
+        )
+        self.keycloak_app_admin_group_name = realm_spec.get(
+            "admin_group", self.keycloak_app_admin_group_name
+        )
+        self.keycloak_app_admin_username = realm_spec.get(
+            "admin_username", self.keycloak_app_admin_username
+        )
+        self.keycloak_app_admin_password = realm_spec.get(
+            "admin_password", self.keycloak_app_admin_password
+        )
+        self.keycloak_app_admin_email = realm_spec.get(
+            "admin_email", self.keycloak_app_admin_email
+        )
+        self.keycloak_app_admin_events_enabled = realm_spec.get(
+            "admin_events_enabled", self.keycloak_app_admin_events_enabled
+        )
+
+
+class AdminTokenProvider:
+    """
+    Master realm admin token shared by several Keycloak clients, refreshed before it expires
+    """
+
+    def __init__(self, keycloak_url, username, password, session=None):
+        """
+        Initializes the token provider
+        """
+        self.keycloak_url = keycloak_url
+        self.username = username
+        self.password = password
+        self.session = session or requests
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires_at = 0
+
+    def get_token(self, refresh=False):
+        """
+        Returns the admin access token, logging in again when it is about to expire
+        """
+        with self.lock:
+            if refresh or self.token is None or time.monotonic() >= self.expires_at:
+                response = self.session.post(
+                    f"{self.keycloak_url}/realms/master/protocol/openid-connect/token",
+                    data={
+                        "grant_type": "password",
+                        "client_id": "admin-cli",
+                        "username": self.username,
+                        "password": self.password,
+                    },
+                    headers={"Content-Type": "application/x-www-form-urlencoded"},
+                )
+                if response.status_code != 200:
+                    raise Exception(
+                        f"Failed to get access token. Status code: {response.status_code}"
+                    )
+                token = response.json()
+                self.token = token["access_token"]
+                # Refresh ahead of the expiry so in-flight requests do not get a 401
+                self.expires_at = time.monotonic() + max(
+                    token.get("expires_in", 60) - 10, 1
+                )
+            return self.token
 
 
 class KeycloakClient(KeycloakConfig):
@@ -29,19 +116,47 @@ class KeycloakClient(KeycloakConfig):
     Keycloak client class used to create the Keycloak admin entries for the app
     """
 
-    def __init__(self):
+    def __init__(self, realm_spec=None, session=None, token_provider=None):
         """
-        Initializes the Keycloak client
+        Initializes the Keycloak client, the session and token provider can be shared
+        between clients bootstrapping several realms
         """
-        super().__init__()
+        super().__init__(realm_spec)
+        self.session = session or requests
+        self.token_provider = token_provider
         self.access_token = None
         self.app_admin_group_id = None
+        self.failures = []
+        self.timings = {}
+
+    @property
+    def access_token(self):
+        """
+        Returns the access token, from the token provider when one is shared
+        """
+        if self.token_provider is not None:
+            return self.token_provider.get_token()
+        return self._access_token
+
+    @access_token.setter
+    def access_token(self, value):
+        self._access_token = value
+
+    def report_failure(self, message):
+        """
+        Prints the failure and records it for the bootstrap summary
+        """
+        print(message)
+        self.failures.append(message)
 
     def get_access_token(self):
         """
         Gets the access token for the Keycloak admin user
         """
-        response = requests.post(
+        if self.token_provider is not None:
+            self.token_provider.get_token(refresh=True)
+            return
+        response = self.session.post(
             f"{self.keycloak_url}/realms/master/protocol/openid-connect/token",
             data={
                 "grant_type": "password",
@@ -58,28 +173,18 @@ class KeycloakClient(KeycloakConfig):
         Creates the Keycloak realm for the app
         """
         # Check if the realm already exists
-        existing_realm = None
-        response = requests.get(
-            f"{self.keycloak_url}/admin/realms",
+        response = self.session.get(
+            f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}",
             headers={
                 "Authorization": f"Bearer {self.access_token}",
                 "Content-Type": "application/json",
             },
         )
-        if response.status_code == 200:
-            realms = response.json()
-            existing_realm = next(
-                (
-                    realm
-                    for realm in realms
-                    if realm["realm"] == self.keycloak_app_realm_name
-                ),
-                None,
-            )
-        else:
+        if response.status_code not in (200, 404):
             raise Exception(
-                f"Failed to retrieve realms. Status code: {response.status_code}"
+                f"Failed to retrieve realm. Status code: {response.status_code}"
             )
+        existing_realm = response.status_code == 200
 
         if existing_realm:
             # Realm already exists, return its ID
@@ -87,7 +192,7 @@ class KeycloakClient(KeycloakConfig):
         else:
             # Realm does not exist, create it
             print(f"Creating new realm: {self.keycloak_app_realm_name}...")
-            response = requests.post(
+            response = self.session.post(
                 f"{self.keycloak_url}/admin/realms",
                 headers={
                     "Authorization": f"Bearer {self.access_token}",
@@ -98,7 +203,70 @@ class KeycloakClient(KeycloakConfig):
             if response.status_code == 201:
                 print(f"Realm '{self.keycloak_app_realm_name}' created successfully.")
             else:
-                print(f"Failed to create realm. Status code: {response.status_code}")
+                self.report_failure(
+                    f"Failed to create realm. Status code: {response.status_code}"
+                )
+
+    def enable_admin_events(self):
+        """
+        Enables admin events and the user events needed to track user changes in the app
+        realm, used to sync the local user directory incrementally
+        """
+        response = self.session.get(
+            f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/events/config",
+            headers={
+                "Authorization": f"Bearer {self.access_token}",
+                "Content-Type": "application/json",
+            },
+        )
+        if response.status_code == 200:
+            events_config = response.json()
+        else:
+            raise Exception(
+                f"Failed to retrieve events config. Status code: {response.status_code}"
+            )
+
+        # Note: an empty list of enabled event types means all event types are saved,
+        # including every LOGIN, so the types are always listed explicitly
+        enabled_event_types = events_config.get("enabledEventTypes") or []
+        missing_event_types = [
+            event_type
+            for event_type in USER_DIRECTORY_EVENT_TYPES
+            if event_type not in enabled_event_types
+        ]
+        if (
+            events_config.get("adminEventsEnabled")
+            and events_config.get("eventsEnabled")
+            and not missing_event_types
+        ):
+            print(
+                f"Admin events already enabled for realm '{self.keycloak_app_realm_name}'."
+            )
+        else:
+            print(
+                f"Enabling admin events for realm '{self.keycloak_app_realm_name}'..."
+            )
+            events_config["adminEventsEnabled"] = True
+            events_config["eventsEnabled"] = True
+            events_config["enabledEventTypes"] = (
+                enabled_event_types + missing_event_types
+            )
+            response = self.session.put(
+                f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/events/config",
+                headers={
+                    "Authorization": f"Bearer {self.access_token}",
+                    "Content-Type": "application/json",
+                },
+                json=events_config,
+            )
+            if response.status_code == 204:
+                print(
+                    f"Admin events enabled for realm '{self.keycloak_app_realm_name}' successfully."
+                )
+            else:
+                self.report_failure(
+                    f"Failed to enable admin events. Status code: {response.status_code}"
+                )
 
     def create_client(self):
         """
@@ -106,7 +274,7 @@ class KeycloakClient(KeycloakConfig):
         """
         # Check if client already exists
         client_exists = False
-        response = requests.get(
+        response = self.session.get(
             f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/clients",
             headers={
                 "Authorization": f"Bearer {self.access_token}",
@@ -127,7 +295,7 @@ class KeycloakClient(KeycloakConfig):
         else:
             # Client does not exist, create it
             print(f"Creating new client: {self.keycloak_app_client_name}...")
-            response = requests.post(
+            response = self.session.post(
                 f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/clients",
                 headers={
                     "Authorization": f"Bearer {self.access_token}",
@@ -142,7 +310,9 @@ class KeycloakClient(KeycloakConfig):
             if response.status_code == 201:
                 print(f"Client '{self.keycloak_app_client_name}' created successfully.")
             else:
-                print(f"Failed to create client. Status code: {response.status_code}")
+                self.report_failure(
+                    f"Failed to create client. Status code: {response.status_code}"
+                )
 
     def create_group(self):
         """
@@ -155,7 +325,7 @@ class KeycloakClient(KeycloakConfig):
             Checks if the group already exists and returns its ID to self.app_admin_group_id if it does in the app realm
             """
             group_exists = False
-            response = requests.get(
+            response = self.session.get(
                 f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/groups",
                 headers={
                     "Authorization": f"Bearer {self.access_token}",
@@ -179,7 +349,7 @@ class KeycloakClient(KeycloakConfig):
         else:
             # Group does not exist, create it
             print(f"Creating new group: {self.keycloak_app_admin_group_name}...")
-            response = requests.post(
+            response = self.session.post(
                 f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/groups",
                 headers={
                     "Authorization": f"Bearer {self.access_token}",
@@ -195,7 +365,9 @@ class KeycloakClient(KeycloakConfig):
                     f"Group '{self.keycloak_app_admin_group_name}' created successfully."
                 )
             else:
-                print(f"Failed to create group. Status code: {response.status_code}")
+                self.report_failure(
+                    f"Failed to create group. Status code: {response.status_code}"
+                )
 
     def assign_admin_roles_to_group(self):
         """
@@ -204,7 +376,7 @@ class KeycloakClient(KeycloakConfig):
         # Get the realm roles which are available/yet to be assigned to the group
         # Note: if there are no roles available, then it would mean that they are already assigned
         realm_roles_to_assign = []
-        response = requests.get(
+        response = self.session.get(
             f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/groups/{self.app_admin_group_id}/role-mappings/realm/available?first=0&max=100",
             headers={
                 "Authorization": f"Bearer {self.access_token}",
@@ -229,7 +401,7 @@ class KeycloakClient(KeycloakConfig):
         # Get the client roles which are available/yet to be assigned to the group
         # Note: if there are no roles available, then it would mean that they are already assigned
         client_roles_to_assign = []
-        response = requests.get(
+        response = self.session.get(
             f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/ui-ext/available-roles/groups/{self.app_admin_group_id}/?first=0&max=1000",
             headers={
                 "Authorization": f"Bearer {self.access_token}",
@@ -257,7 +429,7 @@ class KeycloakClient(KeycloakConfig):
             print(
                 f"Assigning roles '{realm_roles_to_assign}' to group '{self.keycloak_app_admin_group_name}'..."
             )
-            response = requests.post(
+            response = self.session.post(
                 f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/groups/{self.app_admin_group_id}/role-mappings/realm",
                 headers={
                     "Authorization": f"Bearer {self.access_token}",
@@ -270,7 +442,7 @@ class KeycloakClient(KeycloakConfig):
                     f"Roles '{realm_roles_to_assign}' assigned to group '{self.keycloak_app_admin_group_name}' successfully"
                 )
             else:
-                print(
+                self.report_failure(
                     f"Failed to assign roles to group. Status code: {response.status_code}"
                 )
         else:
@@ -285,7 +457,7 @@ class KeycloakClient(KeycloakConfig):
             )
             for client_role in client_roles_to_assign:
                 client_id = client_role.pop("client_id")
-                response = requests.post(
+                response = self.session.post(
                     f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/groups/{self.app_admin_group_id}/role-mappings/clients/{client_id}",
                     headers={
                         "Authorization": f"Bearer {self.access_token}",
@@ -298,7 +470,7 @@ class KeycloakClient(KeycloakConfig):
                         f"Client role {client_role} assigned to group '{self.keycloak_app_admin_group_name}' successfully"
                     )
                 else:
-                    print(
+                    self.report_failure(
                         f"Failed to assign client role {client_role} to group '{self.keycloak_app_admin_group_name}'. Status code: {response.status_code}"
                     )
         else:
@@ -312,7 +484,7 @@ class KeycloakClient(KeycloakConfig):
         """
         # Check if user already exists
         user_exists = False
-        response = requests.get(
+        response = self.session.get(
             f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/users",
             headers={
                 "Authorization": f"Bearer {self.access_token}",
@@ -330,7 +502,7 @@ class KeycloakClient(KeycloakConfig):
         # User does not exist, create it
         if not user_exists:
             print(f"Creating user '{self.keycloak_app_admin_username}'...")
-            response = requests.post(
+            response = self.session.post(
                 f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/users",
                 headers={
                     "Authorization": f"Bearer {self.access_token}",
@@ -353,7 +525,7 @@ class KeycloakClient(KeycloakConfig):
             if response.status_code == 201:
                 print(f"User '{self.keycloak_app_admin_username}' created successfully")
             else:
-                print(
+                self.report_failure(
                     f"Failed to create user '{self.keycloak_app_admin_username}'. Status code: {response.status_code}"
                 )
 
@@ -362,7 +534,7 @@ class KeycloakClient(KeycloakConfig):
         Adds the app admin user to the app admin group in the app realm
         """
         users_to_add_to_group = []
-        response = requests.get(
+        response = self.session.get(
             f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/users?first=0&max=1000",
             headers={
                 "Authorization": f"Bearer {self.access_token}",
@@ -385,7 +557,7 @@ class KeycloakClient(KeycloakConfig):
 
         if users_to_add_to_group:
             for user in users_to_add_to_group:
-                response = requests.put(
+                response = self.session.put(
                     f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}/users/{user['id']}/groups/{self.app_admin_group_id}",
                     headers={"Authorization": f"Bearer {self.access_token}"},
                 )
@@ -394,7 +566,7 @@ class KeycloakClient(KeycloakConfig):
                         f"User '{user['username']}' added to '{self.keycloak_app_admin_group_name}' successfully"
                     )
                 else:
-                    print(
+                    self.report_failure(
                         f"Failed to add user '{user['username']}' to '{self.keycloak_app_admin_group_name}'. Status code: {response.status_code}"
                     )
         else:
@@ -402,16 +574,114 @@ class KeycloakClient(KeycloakConfig):
                 f"No users to add to group, they should already be added to group '{self.keycloak_app_admin_group_name}'"
             )
 
+    def bootstrap_realm(self):
+        """
+        Creates the realm, client, group and admin user for the app and returns the time
+        taken by each step
+        """
+        steps = [self.create_realm]
+        if self.keycloak_app_admin_events_enabled:
+            steps.append(self.enable_admin_events)
+        steps += [
+            self.create_client,
+            self.create_group,
+            self.assign_admin_roles_to_group,
+            self.create_user,
+            self.add_user_to_group,
+        ]
+        self.timings = {}
+        for step in steps:
+            started_at = time.monotonic()
+            step()
+            self.timings[step.__name__] = time.monotonic() - started_at
+        return self.timings
 
-if __name__ == "__main__":
-    keycloak_client = KeycloakClient()
-    keycloak_client.get_access_token()
 
-    keycloak_client.create_realm()
-    keycloak_client.create_client()
+def bootstrap_realms(realm_specs, max_workers=8):
+    """
+    Bootstraps the realms of the realm specs concurrently, sharing one master realm admin
+    token and one connection pool, and prints a per-realm error and timing summary.
+    Every spec must name its realm, client, admin group and admin user
+    """
+    # Specs must not fall back to the environment, or several workers would bootstrap
+    # the same realm at the same time
+    required_keys = [
+        "realm",
+        "client",
+        "admin_group",
+        "admin_username",
+        "admin_password",
+        "admin_email",
+    ]
+    for index, realm_spec in enumerate(realm_specs):
+        missing_keys = [key for key in required_keys if not realm_spec.get(key)]
+        if missing_keys:
+            raise Exception(f"Realm spec {index} is missing {', '.join(missing_keys)}")
+    realm_names = [realm_spec["realm"] for realm_spec in realm_specs]
+    duplicate_names = sorted(
+        {name for name in realm_names if realm_names.count(name) > 1}
+    )
+    if duplicate_names:
+        raise Exception(f"Realm specs repeat realms {', '.join(duplicate_names)}")
 
-    keycloak_client.create_group()
-    keycloak_client.assign_admin_roles_to_group()
+    config = KeycloakConfig()
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    token_provider = AdminTokenProvider(
+        config.keycloak_url,
+        config.keycloak_admin,
+        config.keycloak_admin_password,
+        session=session,
+    )
+    # Log in once up front instead of in every worker
+    token_provider.get_token()
 
-    keycloak_client.create_user()
-    keycloak_client.add_user_to_group()
+    def bootstrap(realm_spec):
+        """
+        Bootstraps one realm and returns its result, errors included
+        """
+        result = {"realm": realm_spec.get("realm"), "error": None, "timings": {}}
+        started_at = time.monotonic()
+        keycloak_client = KeycloakClient(
+            realm_spec, session=session, token_provider=token_provider
+        )
+        try:
+            keycloak_client.bootstrap_realm()
+        except Exception as e:
+            keycloak_client.failures.append(str(e))
+        result["timings"] = keycloak_client.timings
+        if keycloak_client.failures:
+            result["error"] = "; ".join(keycloak_client.failures)
+        result["total"] = time.monotonic() - started_at
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(bootstrap, realm_specs))
+    session.close()
+
+    print("Realm bootstrap summary:")
+    for result in results:
+        status = f"failed: {result['error']}" if result["error"] else "ok"
+        steps = ", ".join(
+            f"{step} {duration:.2f}s" for step, duration in result["timings"].items()
+        )
+        print(f"  {result['realm']}: {status} in {result['total']:.2f}s ({steps})")
+    failed = [result["realm"] for result in results if result["error"]]
+    print(f"Bootstrapped {len(results) - len(failed)}/{len(results)} realms")
+    return results
+
+
+if __name__ == "__main__":
+    realm_specs_file = os.environ.get("KEYCLOAK_REALM_SPECS_FILE")
+    if realm_specs_file:
+        with open(realm_specs_file) as f:
+            bootstrap_realms(
+                json.load(f),
+                max_workers=int(os.environ.get("KEYCLOAK_BOOTSTRAP_WORKERS", "8")),
+            )
+    else:
+        keycloak_client = KeycloakClient()
+        keycloak_client.get_access_token()
+        keycloak_client.bootstrap_realm()
@@ -0,0 +1,323 @@
+try:
+    from .keycloak_setup import KeycloakClient, USER_DIRECTORY_EVENT_TYPES
+except ImportError:
+    # Run as a script from the database_keycloak_setup directory
+    from keycloak_setup import KeycloakClient, USER_DIRECTORY_EVENT_TYPES
+import threading
+import time
+
+
+class UserDirectory:
+    """
+    In-memory user directory indexed by id, username and email
+    """
+
+    def __init__(self):
+        """
+        Initializes the empty directory
+        """
+        self.lock = threading.Lock()
+        self.users_by_id = {}
+        self.ids_by_username = {}
+        self.ids_by_email = {}
+
+    def put(self, user):
+        """
+        Adds or replaces the user in the directory
+        """
+        entry = {
+            "id": user["id"],
+            "username": user.get("username"),
+            "email": user.get("email"),
+            "firstName": user.get("firstName"),
+            "lastName": user.get("lastName"),
+            "enabled": user.get("enabled", True),
+        }
+        with self.lock:
+            self._remove(entry["id"])
+            self.users_by_id[entry["id"]] = entry
+            if entry["username"]:
+                self.ids_by_username[entry["username"].lower()] = entry["id"]
+            if entry["email"]:
+                self.ids_by_email[entry["email"].lower()] = entry["id"]
+
+    def remove(self, user_id):
+        """
+        Removes the user from the directory
+        """
+        with self.lock:
+            self._remove(user_id)
+
+    def replace_all(self, users):
+        """
+        Replaces the whole directory with the given users
+        """
+        directory = UserDirectory()
+        for user in users:
+            directory.put(user)
+        with self.lock:
+            self.users_by_id = directory.users_by_id
+            self.ids_by_username = directory.ids_by_username
+            self.ids_by_email = directory.ids_by_email
+
+    def get_by_id(self, user_id):
+        """
+        Returns the user with the given id or None
+        """
+        with self.lock:
+            user = self.users_by_id.get(user_id)
+            return dict(user) if user else None
+
+    def get_by_username(self, username):
+        """
+        Returns the user with the given username (case-insensitive) or None
+        """
+        with self.lock:
+            user_id = self.ids_by_username.get(username.lower())
+            return dict(self.users_by_id[user_id]) if user_id else None
+
+    def get_by_email(self, email):
+        """
+        Returns the user with the given email (case-insensitive) or None
+        """
+        with self.lock:
+            user_id = self.ids_by_email.get(email.lower())
+            return dict(self.users_by_id[user_id]) if user_id else None
+
+    def __len__(self):
+        """
+        Returns the number of users in the directory
+        """
+        with self.lock:
+            return len(self.users_by_id)
+
+    def _remove(self, user_id):
+        """
+        Removes the user and its index entries, must be called with the lock held.
+        An index entry is only removed while it still points to this user, as the
+        username or email may have been taken over by another user since
+        """
+        user = self.users_by_id.pop(user_id, None)
+        if user is None:
+            return
+        for index, key in (
+            (self.ids_by_username, user["username"]),
+            (self.ids_by_email, user["email"]),
+        ):
+            if key and index.get(key.lower()) == user_id:
+                del index[key.lower()]
+
+
+class KeycloakUserDirectorySync(KeycloakClient):
+    """
+    Keeps a local user directory of the app realm in sync with Keycloak, with one full
+    paged load followed by incremental updates from the admin and user events
+    """
+
+    def __init__(self, directory=None, page_size=100, clock_skew=60):
+        """
+        Initializes the sync, every poll re-reads the events of the last clock_skew seconds
+        before the checkpoint, so that events are not missed if the Keycloak clock is behind
+        or an event is committed after a later one (events are timestamped before commit)
+        """
+        super().__init__()
+        self.directory = directory if directory is not None else UserDirectory()
+        self.page_size = page_size
+        self.clock_skew = clock_skew
+        # Time (epoch millis, Keycloak clock) of the latest event applied
+        self.checkpoint = None
+        # Times of the events already applied within the overlap window, keyed by event
+        self.seen_events = {}
+
+    def full_load(self):
+        """
+        Loads all users of the app realm page by page and resets the checkpoint
+        """
+        self.check_events_config()
+        checkpoint = int((time.time() - self.clock_skew) * 1000)
+        users = []
+        first = 0
+        while True:
+            page = self._get(
+                f"/users?first={first}&max={self.page_size}&briefRepresentation=true"
+            )
+            users.extend(page)
+            if len(page) < self.page_size:
+                break
+            first += self.page_size
+        self.directory.replace_all(users)
+        self.checkpoint = checkpoint
+        self.seen_events = {}
+        print(f"Loaded {len(users)} users from realm '{self.keycloak_app_realm_name}'")
+
+    def sync(self):
+        """
+        Applies the user changes since the checkpoint and returns the number of users updated
+        """
+        if self.checkpoint is None:
+            self.full_load()
+            return len(self.directory)
+
+        event_types = "&".join(f"type={t}" for t in USER_DIRECTORY_EVENT_TYPES)
+        events = [
+            ("admin", event)
+            for event in self._get_events("/admin-events?resourceTypes=USER")
+        ] + [("user", event) for event in self._get_events(f"/events?{event_types}")]
+
+        user_ids = []
+        checkpoint = self.checkpoint
+        seen_events = dict(self.seen_events)
+        for kind, event in sorted(events, key=lambda item: item[1]["time"]):
+            key = self._event_key(kind, event)
+            if key in seen_events:
+                continue
+            user_id = self._event_user_id(kind, event)
+            if user_id and user_id not in user_ids:
+                user_ids.append(user_id)
+            checkpoint = max(checkpoint, event["time"])
+            seen_events[key] = event["time"]
+
+        # Only the changed users cross the network, with their current representation
+        for user_id in user_ids:
+            response = self._request("get", f"/users/{user_id}")
+            if response.status_code == 200:
+                self.directory.put(response.json())
+            elif response.status_code == 404:
+                self.directory.remove(user_id)
+            else:
+                raise Exception(
+                    f"Failed to retrieve user '{user_id}'. Status code: {response.status_code}"
+                )
+
+        self.checkpoint = checkpoint
+        # Only the events which the next poll reads again need to be remembered
+        self.seen_events = {
+            key: event_time
+            for key, event_time in seen_events.items()
+            if event_time >= self._window_start()
+        }
+        if user_ids:
+            print(
+                f"Synced {len(user_ids)} changed users from realm '{self.keycloak_app_realm_name}'"
+            )
+        return len(user_ids)
+
+    def run(self, interval=30, stop_event=None):
+        """
+        Syncs the directory every interval seconds until the stop event is set
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Error: {e}")
+            stop_event.wait(interval)
+
+    def check_events_config(self):
+        """
+        Raises if the admin or user events the sync relies on are not enabled on the realm,
+        as the directory would otherwise silently go stale
+        """
+        events_config = self._get("/events/config")
+        enabled_event_types = events_config.get("enabledEventTypes") or []
+        missing_event_types = [
+            event_type
+            for event_type in USER_DIRECTORY_EVENT_TYPES
+            if enabled_event_types and event_type not in enabled_event_types
+        ]
+        if (
+            not events_config.get("adminEventsEnabled")
+            or not events_config.get("eventsEnabled")
+            or missing_event_types
+        ):
+            raise Exception(
+                f"Admin and user events are not enabled for realm '{self.keycloak_app_realm_name}', "
+                "run keycloak_setup.py with KEYCLOAK_APP_ADMIN_EVENTS_ENABLED=true"
+            )
+
+    def _window_start(self):
+        """
+        Returns the time (epoch millis) from which each poll reads the events
+        """
+        return self.checkpoint - self.clock_skew * 1000
+
+    def _get_events(self, path):
+        """
+        Returns all events of the given events endpoint since the start of the window
+        """
+        events = []
+        first = 0
+        while True:
+            page = self._get(
+                f"{path}&dateFrom={self._window_start()}&first={first}&max={self.page_size}"
+            )
+            events.extend(page)
+            if len(page) < self.page_size:
+                return events
+            first += self.page_size
+
+    def _get(self, path):
+        """
+        Returns the JSON response of a GET on the app realm admin API
+        """
+        response = self._request("get", path)
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to retrieve '{path}'. Status code: {response.status_code}"
+            )
+        return response.json()
+
+    def _request(self, method, path):
+        """
+        Sends a request to the app realm admin API, refreshing the admin token once when
+        it has expired
+        """
+        if self.access_token is None:
+            self.get_access_token()
+        for attempt in range(2):
+            response = self.session.request(
+                method,
+                f"{self.keycloak_url}/admin/realms/{self.keycloak_app_realm_name}{path}",
+                headers={
+                    "Authorization": f"Bearer {self.access_token}",
+                    "Content-Type": "application/json",
+                },
+            )
+            if response.status_code != 401 or attempt == 1:
+                return response
+            self.get_access_token()
+
+    @staticmethod
+    def _event_key(kind, event):
+        """
+        Returns a key identifying the event, used to skip events already applied
+        """
+        if event.get("id"):
+            return (kind, event["id"])
+        return (
+            kind,
+            event["time"],
+            event.get("resourcePath") or event.get("userId"),
+            event.get("operationType") or event.get("type"),
+        )
+
+    @staticmethod
+    def _event_user_id(kind, event):
+        """
+        Returns the id of the user changed by the event, or None
+        """
+        if kind == "user":
+            return event.get("userId")
+        # Admin event resource paths look like users/<id> or users/<id>/reset-password
+        parts = (event.get("resourcePath") or "").split("/")
+        if len(parts) >= 2 and parts[0] == "users":
+            return parts[1]
+        return None
+
+
+if __name__ == "__main__":
+    user_directory_sync = KeycloakUserDirectorySync()
+    user_directory_sync.get_access_token()
+    user_directory_sync.full_load()
+    user_directory_sync.run()
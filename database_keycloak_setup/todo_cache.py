@@ -0,0 +1,270 @@
+from collections import OrderedDict
+import select
+import threading
+import psycopg2
+import os
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class TodoListCache:
+    """
+    Bounded in-process LRU cache of todo lists keyed by user id
+    """
+
+    def __init__(self, loader, max_size=1024):
+        """
+        Initializes the cache, loader is called with a user id on a cache miss
+        """
+        self.loader = loader
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Bumped on invalidation so that a load which raced with a change is not cached
+        self.generation = 0
+        self.user_generations = {}
+        self.loading = {}
+
+    def get(self, user_id):
+        """
+        Returns the todo list of the user, loading it on a cache miss.
+        Concurrent misses for the same user wait for a single load
+        """
+        user_id = str(user_id)
+        while True:
+            with self.lock:
+                if user_id in self.entries:
+                    self.entries.move_to_end(user_id)
+                    return [dict(todo) for todo in self.entries[user_id]]
+                in_flight = self.loading.get(user_id)
+                if in_flight is None:
+                    in_flight = threading.Event()
+                    self.loading[user_id] = in_flight
+                    generation = self._get_generation(user_id)
+                    break
+            # Another thread is loading this user, wait for it and check the cache again
+            in_flight.wait()
+
+        try:
+            # Rows are copied in and out so that callers never share a cached dict
+            todos = tuple(dict(todo) for todo in self.loader(user_id))
+            with self.lock:
+                if self._get_generation(user_id) == generation:
+                    self.entries[user_id] = todos
+                    self.entries.move_to_end(user_id)
+                    while len(self.entries) > self.max_size:
+                        self.entries.popitem(last=False)
+            return [dict(todo) for todo in todos]
+        finally:
+            with self.lock:
+                self.loading.pop(user_id, None)
+                self.user_generations.pop(user_id, None)
+            in_flight.set()
+
+    def invalidate(self, user_id):
+        """
+        Removes the todo list of the user from the cache
+        """
+        user_id = str(user_id)
+        with self.lock:
+            self.entries.pop(user_id, None)
+            # Only users being loaded need a generation to detect the race
+            if user_id in self.loading:
+                self.user_generations[user_id] = (
+                    self.user_generations.get(user_id, 0) + 1
+                )
+
+    def clear(self):
+        """
+        Removes all todo lists from the cache
+        """
+        with self.lock:
+            self.entries.clear()
+            self.user_generations.clear()
+            self.generation += 1
+
+    def _get_generation(self, user_id):
+        """
+        Returns the generation of the user entry, must be called with the lock held
+        """
+        return (self.generation, self.user_generations.get(user_id, 0))
+
+
+class TodoCacheInvalidationListener(threading.Thread):
+    """
+    Background thread which LISTENs for todo change notifications and invalidates the cache
+    """
+
+    def __init__(
+        self,
+        cache,
+        channel,
+        host,
+        port,
+        database,
+        user,
+        password,
+        poll_timeout=5,
+        reconnect_delay=1,
+    ):
+        """
+        Initializes the listener with its own dedicated connection settings
+        """
+        super().__init__(daemon=True)
+        self.cache = cache
+        self.channel = channel
+        self.connection_settings = {
+            "host": host,
+            "port": port,
+            "database": database,
+            "user": user,
+            "password": password,
+        }
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self.stop_event = threading.Event()
+        self.connection = None
+
+    def run(self):
+        """
+        Listens for notifications until stopped, reconnecting on any error so that the
+        cache is never left without invalidations
+        """
+        while not self.stop_event.is_set():
+            try:
+                self._connect()
+                self._listen()
+            except Exception as e:
+                print(f"Error: {e}")
+                self.stop_event.wait(self.reconnect_delay)
+            finally:
+                self._close()
+                # Notifications may have been missed while disconnected
+                self.cache.clear()
+
+    def stop(self):
+        """
+        Stops the listener and waits for it to exit
+        """
+        self.stop_event.set()
+        self.join()
+
+    def _connect(self):
+        """
+        Opens the listener connection and subscribes to the channel
+        """
+        self.connection = psycopg2.connect(**self.connection_settings)
+        self.connection.autocommit = True
+        with self.connection.cursor() as cur:
+            cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+        # Entries cached before the subscription may already be stale
+        self.cache.clear()
+
+    def _listen(self):
+        """
+        Applies the invalidations received on the listener connection
+        """
+        while not self.stop_event.is_set():
+            readable, _, _ = select.select([self.connection], [], [], self.poll_timeout)
+            if not readable:
+                continue
+            self.connection.poll()
+            while self.connection.notifies:
+                notify = self.connection.notifies.pop(0)
+                if notify.payload == "*":
+                    self.cache.clear()
+                else:
+                    self.cache.invalidate(notify.payload)
+
+    def _close(self):
+        """
+        Closes the listener connection
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def create_todo_list_cache(max_size=None):
+    """
+    Creates the todo list cache for the app database and starts its invalidation listener.
+    Returns the cache, the listener and the connection pool used to load todo lists
+    """
+    app_host = os.environ["TODO_APP_HOST"]
+    app_port = os.environ["TODO_APP_PORT"]
+    app_database = os.environ["TODO_APP_DB"]
+    app_user = os.environ["TODO_APP_DB_USER"]
+    app_user_password = os.environ["TODO_APP_DB_PASSWORD"]
+    app_schema = os.environ["TODO_APP_SCHEMA"]
+    app_table = os.environ.get("TODO_APP_TABLE", "todos")
+    app_cache_channel = os.environ.get(
+        "TODO_APP_CACHE_CHANNEL", "todo_cache_invalidation"
+    )
+    if max_size is None:
+        max_size = int(os.environ.get("TODO_APP_CACHE_MAX_SIZE", "1024"))
+
+    pool_size = int(os.environ.get("TODO_APP_CACHE_POOL_SIZE", "10"))
+
+    query = sql.SQL("SELECT * FROM {} WHERE user_id = %s ORDER BY id").format(
+        sql.Identifier(app_schema, app_table)
+    )
+    pool = ThreadedConnectionPool(
+        1,
+        pool_size,
+        host=app_host,
+        port=app_port,
+        database=app_database,
+        user=app_user,
+        password=app_user_password,
+    )
+    connection = pool.getconn()
+    try:
+        connection.autocommit = True
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM pg_trigger "
+                "WHERE tgrelid = to_regclass(quote_ident(%s) || '.' || quote_ident(%s)) "
+                "AND tgname = 'todo_cache_invalidate' AND tgenabled <> 'D'",
+                (app_schema, app_table),
+            )
+            trigger_installed = cur.fetchone() is not None
+    finally:
+        pool.putconn(connection)
+    if not trigger_installed:
+        pool.closeall()
+        # Without the trigger nothing is notified and cached lists would never expire
+        raise Exception(
+            f"Trigger 'todo_cache_invalidate' is missing or disabled on table "
+            f"'{app_schema}.{app_table}', run db_setup.py to install it"
+        )
+
+    # The pool raises instead of waiting when it is exhausted, so callers queue here
+    pool_slots = threading.BoundedSemaphore(pool_size)
+
+    def load_todo_list(user_id):
+        """
+        Loads the todo list of the user from the database with a pooled connection
+        """
+        with pool_slots:
+            connection = pool.getconn()
+            try:
+                connection.autocommit = True
+                with connection.cursor() as cur:
+                    cur.execute(query, (user_id,))
+                    columns = [column.name for column in cur.description]
+                    return [dict(zip(columns, row)) for row in cur.fetchall()]
+            finally:
+                pool.putconn(connection, close=bool(connection.closed))
+
+    cache = TodoListCache(load_todo_list, max_size=max_size)
+    listener = TodoCacheInvalidationListener(
+        cache,
+        app_cache_channel,
+        host=app_host,
+        port=app_port,
+        database=app_database,
+        user=app_user,
+        password=app_user_password,
+    )
+    listener.start()
+    return cache, listener, pool
@@ -0,0 +1,188 @@
+from database_keycloak_setup.keycloak_user_directory import (
+    KeycloakUserDirectorySync,
+    UserDirectory,
+)
+import unittest
+
+
+class FakeResponse:
+    """
+    Minimal requests response returned by the stubbed admin API
+    """
+
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class UserDirectoryTest(unittest.TestCase):
+    """
+    Tests for the in-memory user directory
+    """
+
+    def test_lookups_are_case_insensitive(self):
+        """
+        Users are found by id, username and email regardless of case
+        """
+        directory = UserDirectory()
+        directory.put({"id": "a", "username": "Bob", "email": "Bob@example.com"})
+        self.assertEqual(directory.get_by_id("a")["username"], "Bob")
+        self.assertEqual(directory.get_by_username("bob")["id"], "a")
+        self.assertEqual(directory.get_by_email("BOB@example.com")["id"], "a")
+        self.assertIsNone(directory.get_by_username("alice"))
+
+    def test_renamed_user_keeps_username_taken_over(self):
+        """
+        Renaming a user does not remove the index entry of the user who took its old name
+        """
+        directory = UserDirectory()
+        directory.put({"id": "a", "username": "bob", "email": "bob@example.com"})
+        directory.put({"id": "b", "username": "bob", "email": "bob@example.com"})
+        directory.put({"id": "a", "username": "rob", "email": "rob@example.com"})
+        self.assertEqual(directory.get_by_username("bob")["id"], "b")
+        self.assertEqual(directory.get_by_email("bob@example.com")["id"], "b")
+        self.assertEqual(directory.get_by_username("rob")["id"], "a")
+
+    def test_remove(self):
+        """
+        A removed user is no longer found
+        """
+        directory = UserDirectory()
+        directory.put({"id": "a", "username": "bob", "email": "bob@example.com"})
+        directory.remove("a")
+        self.assertEqual(len(directory), 0)
+        self.assertIsNone(directory.get_by_username("bob"))
+        self.assertIsNone(directory.get_by_email("bob@example.com"))
+
+
+class KeycloakUserDirectorySyncTest(unittest.TestCase):
+    """
+    Tests for the incremental user directory sync, with a stubbed admin API
+    """
+
+    def setUp(self):
+        self.users = {
+            "a": {"id": "a", "username": "alice", "email": "alice@example.com"},
+            "b": {"id": "b", "username": "bob", "email": "bob@example.com"},
+        }
+        self.admin_events = []
+        self.user_events = []
+        self.requests = []
+        self.sync = KeycloakUserDirectorySync(page_size=100, clock_skew=60)
+        self.sync._request = self._request
+
+    def _request(self, method, path):
+        """
+        Serves the admin API paths used by the sync from the test state
+        """
+        self.requests.append(path)
+        if path == "/events/config":
+            return FakeResponse(
+                200,
+                {
+                    "adminEventsEnabled": True,
+                    "eventsEnabled": True,
+                    "enabledEventTypes": [],
+                },
+            )
+        if path.startswith("/users?"):
+            return FakeResponse(200, list(self.users.values()))
+        if path.startswith("/admin-events?"):
+            return FakeResponse(200, self.admin_events)
+        if path.startswith("/events?"):
+            return FakeResponse(200, self.user_events)
+        user = self.users.get(path[len("/users/") :])
+        return FakeResponse(200, user) if user else FakeResponse(404)
+
+    def test_first_sync_loads_every_user(self):
+        """
+        The first sync does a full load
+        """
+        self.assertEqual(self.sync.sync(), 2)
+        self.assertEqual(self.sync.directory.get_by_username("bob")["id"], "b")
+        self.assertIsNotNone(self.sync.checkpoint)
+
+    def test_sync_refetches_changed_users_once(self):
+        """
+        Only the users changed by new events are fetched, events already applied in the
+        overlap window are skipped on the next poll
+        """
+        self.sync.full_load()
+        checkpoint = self.sync.checkpoint
+        self.users["a"]["email"] = "alice@example.org"
+        self.users["c"] = {"id": "c", "username": "carol", "email": None}
+        del self.users["b"]
+        self.admin_events = [
+            {
+                "id": "1",
+                "time": checkpoint + 10,
+                "resourcePath": "users/a",
+                "operationType": "UPDATE",
+            },
+            {
+                "id": "2",
+                "time": checkpoint + 20,
+                "resourcePath": "users/b",
+                "operationType": "DELETE",
+            },
+        ]
+        self.user_events = [
+            {"id": "3", "time": checkpoint + 30, "userId": "c", "type": "REGISTER"},
+            {"id": "4", "time": checkpoint + 40, "userId": "a", "type": "UPDATE_EMAIL"},
+        ]
+        self.requests = []
+
+        self.assertEqual(self.sync.sync(), 3)
+        self.assertEqual(
+            sorted(path for path in self.requests if path.startswith("/users/")),
+            ["/users/a", "/users/b", "/users/c"],
+        )
+        self.assertEqual(self.sync.checkpoint, checkpoint + 40)
+        directory = self.sync.directory
+        self.assertEqual(directory.get_by_id("a")["email"], "alice@example.org")
+        self.assertIsNone(directory.get_by_email("alice@example.com"))
+        self.assertIsNone(directory.get_by_id("b"))
+        self.assertEqual(directory.get_by_username("carol")["id"], "c")
+
+        # The same events are read again within the overlap window
+        self.requests = []
+        self.assertEqual(self.sync.sync(), 0)
+        self.assertFalse(any(path.startswith("/users/") for path in self.requests))
+
+    def test_sync_reads_events_from_before_the_checkpoint(self):
+        """
+        Each poll reads the events from clock_skew seconds before the checkpoint
+        """
+        self.sync.full_load()
+        checkpoint = self.sync.checkpoint
+        self.requests = []
+        self.sync.sync()
+        self.assertTrue(
+            all(
+                f"dateFrom={checkpoint - 60000}" in path
+                for path in self.requests
+                if "events?" in path
+            )
+        )
+
+    def test_full_load_requires_events(self):
+        """
+        The full load fails when the realm does not save the events the sync relies on
+        """
+        request = self._request
+
+        def events_disabled(method, path):
+            if path == "/events/config":
+                return FakeResponse(200, {"adminEventsEnabled": False})
+            return request(method, path)
+
+        self.sync._request = events_disabled
+        with self.assertRaises(Exception):
+            self.sync.full_load()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+from database_keycloak_setup.todo_cache import TodoListCache
+import threading
+import time
+import unittest
+
+
+class TodoListCacheTest(unittest.TestCase):
+    """
+    Tests for the in-process todo list cache
+    """
+
+    def test_concurrent_misses_share_one_load(self):
+        """
+        Concurrent misses for the same user wait for a single load
+        """
+        calls = []
+        release = threading.Event()
+
+        def loader(user_id):
+            calls.append(user_id)
+            release.wait(5)
+            return [{"id": 1, "user_id": user_id}]
+
+        cache = TodoListCache(loader)
+        barrier = threading.Barrier(8)
+        results = []
+
+        def get():
+            barrier.wait(5)
+            results.append(cache.get("alice"))
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        # Give every thread time to miss the cache while the first load is blocked
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(calls, ["alice"])
+        self.assertEqual(results, [[{"id": 1, "user_id": "alice"}]] * 8)
+
+    def test_invalidation_during_load_is_not_cached(self):
+        """
+        A list loaded while the user was invalidated is returned but not cached
+        """
+        versions = iter(["stale", "fresh"])
+        cache = None
+
+        def loader(user_id):
+            title = next(versions)
+            if title == "stale":
+                cache.invalidate(user_id)
+            return [{"id": 1, "title": title}]
+
+        cache = TodoListCache(loader)
+        self.assertEqual(cache.get("alice"), [{"id": 1, "title": "stale"}])
+        self.assertNotIn("alice", cache.entries)
+        self.assertEqual(cache.get("alice"), [{"id": 1, "title": "fresh"}])
+        self.assertEqual(cache.get("alice"), [{"id": 1, "title": "fresh"}])
+
+    def test_clear_during_load_is_not_cached(self):
+        """
+        A list loaded while the whole cache was cleared is not cached
+        """
+        cache = None
+
+        def loader(user_id):
+            cache.clear()
+            return []
+
+        cache = TodoListCache(loader)
+        cache.get("alice")
+        self.assertNotIn("alice", cache.entries)
+
+    def test_returned_rows_are_copies(self):
+        """
+        Changing a returned row does not change the cached list
+        """
+        cache = TodoListCache(lambda user_id: [{"id": 1, "completed": False}])
+        cache.get("alice")[0]["completed"] = True
+        cache.get("alice")[0]["completed"] = True
+        self.assertEqual(cache.get("alice"), [{"id": 1, "completed": False}])
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """
+        The least recently used list is evicted once the cache is full
+        """
+        calls = []
+
+        def loader(user_id):
+            calls.append(user_id)
+            return []
+
+        cache = TodoListCache(loader, max_size=2)
+        cache.get("alice")
+        cache.get("bob")
+        cache.get("alice")
+        cache.get("carol")
+        self.assertEqual(list(cache.entries), ["alice", "carol"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import base64
+import hvac
+import os
+import threading
+import time
+
+ENVELOPE_PREFIX = "envelope:v1:"
+
+
+class VaultTransitClient:
+    """
+    Vault transit client used to encrypt and decrypt sensitive todo fields in batches
+    """
+
+    def __init__(
+        self,
+        url,
+        token,
+        key_name,
+        mount_point="transit",
+        batch_size=250,
+        max_workers=4,
+        data_key_ttl=300,
+        data_key_max_uses=1000000,
+    ):
+        """
+        Initializes the transit client
+        """
+        self.client = hvac.Client(url=url, token=token)
+        self.key_name = key_name
+        self.mount_point = mount_point
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.data_key_ttl = data_key_ttl
+        self.data_key_max_uses = data_key_max_uses
+        self.lock = threading.Lock()
+        # Current local data key used to encrypt in envelope mode
+        self.data_key = None
+        # Unwrapped data keys used to decrypt envelope ciphertexts, keyed by wrapped key
+        self.unwrapped_keys = {}
+
+    def encrypt_batch(self, plaintexts, envelope=False):
+        """
+        Encrypts the plaintexts (str or bytes, None is passed through) and returns the
+        ciphertexts in the same order. Transit mode sends the values to Vault in chunks of
+        batch_size through batch_input, envelope mode encrypts locally with a short-lived
+        data key generated by Vault
+        """
+        plaintexts = [
+            value.encode("utf-8") if isinstance(value, str) else value
+            for value in plaintexts
+        ]
+        indexes = [i for i, value in enumerate(plaintexts) if value is not None]
+        values = [plaintexts[i] for i in indexes]
+
+        if envelope:
+            encrypted = [self._envelope_encrypt(value) for value in values]
+        else:
+            batch_input = [
+                {"plaintext": base64.b64encode(value).decode("ascii")}
+                for value in values
+            ]
+            encrypted = [
+                result["ciphertext"] for result in self._transit("encrypt", batch_input)
+            ]
+
+        ciphertexts = [None] * len(plaintexts)
+        for i, ciphertext in zip(indexes, encrypted):
+            ciphertexts[i] = ciphertext
+        return ciphertexts
+
+    def decrypt_batch(self, ciphertexts, encoding="utf-8"):
+        """
+        Decrypts transit and envelope ciphertexts (None is passed through) and returns the
+        plaintexts in the same order, decoded with encoding unless it is None
+        """
+        plaintexts = [None] * len(ciphertexts)
+        transit_indexes = []
+        envelope_indexes = []
+        for i, ciphertext in enumerate(ciphertexts):
+            if ciphertext is None:
+                continue
+            if ciphertext.startswith(ENVELOPE_PREFIX):
+                envelope_indexes.append(i)
+            else:
+                transit_indexes.append(i)
+
+        if transit_indexes:
+            batch_input = [{"ciphertext": ciphertexts[i]} for i in transit_indexes]
+            results = self._transit("decrypt", batch_input)
+            for i, result in zip(transit_indexes, results):
+                plaintexts[i] = base64.b64decode(result["plaintext"])
+
+        if envelope_indexes:
+            # Unwrap every distinct data key once, all in one batched transit call
+            envelopes = {
+                i: ciphertexts[i][len(ENVELOPE_PREFIX) :].split(":", 1)
+                for i in envelope_indexes
+            }
+            keys = self._unwrap_data_keys(
+                {wrapped for _, wrapped in envelopes.values()}
+            )
+            for i, (payload, wrapped) in envelopes.items():
+                payload = base64.b64decode(payload)
+                plaintexts[i] = AESGCM(keys[wrapped]).decrypt(
+                    payload[:12], payload[12:], None
+                )
+
+        if encoding is not None:
+            plaintexts = [
+                value.decode(encoding) if value is not None else None
+                for value in plaintexts
+            ]
+        return plaintexts
+
+    def clear_data_keys(self):
+        """
+        Drops the local data keys so that the next envelope operation goes back to Vault
+        """
+        with self.lock:
+            self.data_key = None
+            self.unwrapped_keys.clear()
+
+    def _transit(self, operation, batch_input):
+        """
+        Sends the batch input to the transit encrypt or decrypt endpoint in chunks of
+        batch_size, up to max_workers chunks in flight, and returns the results in order
+        """
+        if operation == "encrypt":
+            call = self.client.secrets.transit.encrypt_data
+        else:
+            call = self.client.secrets.transit.decrypt_data
+
+        def send_chunk(chunk):
+            """
+            Sends one chunk and checks each item for an error
+            """
+            response = call(
+                name=self.key_name, batch_input=chunk, mount_point=self.mount_point
+            )
+            results = response["data"]["batch_results"]
+            for result in results:
+                if result.get("error"):
+                    raise Exception(
+                        f"Failed to {operation} with transit key '{self.key_name}': {result['error']}"
+                    )
+            return results
+
+        chunks = [
+            batch_input[i : i + self.batch_size]
+            for i in range(0, len(batch_input), self.batch_size)
+        ]
+        if len(chunks) <= 1:
+            return [result for chunk in chunks for result in send_chunk(chunk)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return [
+                result
+                for results in executor.map(send_chunk, chunks)
+                for result in results
+            ]
+
+    def _envelope_encrypt(self, value):
+        """
+        Encrypts the value locally with the current data key, rotating it when expired
+        """
+        with self.lock:
+            if (
+                self.data_key is None
+                or time.monotonic() - self.data_key["created_at"] > self.data_key_ttl
+                or self.data_key["uses"] >= self.data_key_max_uses
+            ):
+                response = self.client.secrets.transit.generate_data_key(
+                    name=self.key_name,
+                    key_type="plaintext",
+                    bits=256,
+                    mount_point=self.mount_point,
+                )
+                self.data_key = {
+                    "key": base64.b64decode(response["data"]["plaintext"]),
+                    "wrapped": response["data"]["ciphertext"],
+                    "created_at": time.monotonic(),
+                    "uses": 0,
+                }
+            self.data_key["uses"] += 1
+            key = self.data_key["key"]
+            wrapped = self.data_key["wrapped"]
+
+        nonce = os.urandom(12)
+        payload = base64.b64encode(nonce + AESGCM(key).encrypt(nonce, value, None))
+        return f"{ENVELOPE_PREFIX}{payload.decode('ascii')}:{wrapped}"
+
+    def _unwrap_data_keys(self, wrapped_keys):
+        """
+        Returns the unwrapped data keys, decrypting the ones which are not cached or have
+        expired through transit
+        """
+        now = time.monotonic()
+        with self.lock:
+            # Drop the expired keys so that the cache stays bounded
+            for wrapped, (_, unwrapped_at) in list(self.unwrapped_keys.items()):
+                if now - unwrapped_at > self.data_key_ttl:
+                    del self.unwrapped_keys[wrapped]
+            keys = {
+                wrapped: self.unwrapped_keys[wrapped][0]
+                for wrapped in wrapped_keys
+                if wrapped in self.unwrapped_keys
+            }
+        missing = [wrapped for wrapped in wrapped_keys if wrapped not in keys]
+        if missing:
+            results = self._transit(
+                "decrypt", [{"ciphertext": wrapped} for wrapped in missing]
+            )
+            with self.lock:
+                for wrapped, result in zip(missing, results):
+                    keys[wrapped] = base64.b64decode(result["plaintext"])
+                    self.unwrapped_keys[wrapped] = (keys[wrapped], now)
+        return keys
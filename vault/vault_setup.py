@@ -45,6 +45,21 @@ class VaultClient:
             else:
                 print(f"Error creating policy: {response.text}")
 
+    def create_transit_key(self, name, mount_point):
+        """
+        Creates a new transit encryption key
+        """
+        # Check if the transit key already exists
+        try:
+            self.client.secrets.transit.read_key(name=name, mount_point=mount_point)
+            print(f"Transit key '{name}' already exists!")
+        except hvac.exceptions.InvalidPath:
+            # Create a new transit key
+            self.client.secrets.transit.create_key(
+                name=name, key_type="aes256-gcm96", mount_point=mount_point
+            )
+            print(f"Transit key '{name}' created successfully!")
+
     def create_auth_method(self, name):
         """
         Creates a new auth method
@@ -96,6 +111,20 @@ class VaultClient:
             # Create a new user
             __create_user(username, password, policy_name, auth_method_name)
 
+    def update_user_policies(self, username, policy_names, auth_method_name):
+        """
+        Sets the policies of an existing user, keeping its password
+        """
+        response = self.client.auth.userpass.create_or_update_user(
+            username=username,
+            policies=policy_names,
+            mount_point=auth_method_name,
+        )
+        if response.status_code == 204:
+            print(f"User '{username}' policies set to {policy_names} successfully!")
+        else:
+            print(f"Error updating user policies: {response.text}")
+
 
 class VaultConfig:
 
@@ -109,6 +138,9 @@ class VaultConfig:
         auth_method_name,
         user_name,
         password,
+        transit_engine_name=None,
+        transit_key_name=None,
+        transit_policy_name=None,
     ):
         self.url = url
         self.token = None
@@ -121,6 +153,9 @@ class VaultConfig:
         self.auth_method_name = auth_method_name
         self.user_name = user_name
         self.password = password
+        self.transit_engine_name = transit_engine_name
+        self.transit_key_name = transit_key_name
+        self.transit_policy_name = transit_policy_name
 
     def initialize_and_unseal_vault(self):
         """
@@ -165,15 +200,33 @@ class VaultConfig:
 
     def configure_vault(self):
         """
-        Configures the vault server with the required secret engine, policy, auth method and user
+        Configures the vault server with the required secret engine, policy, auth method and user.
+        The transit engine, key and policy are configured when a transit engine name is set
         """
+        if self.transit_engine_name and not (
+            self.transit_key_name and self.transit_policy_name
+        ):
+            raise Exception(
+                "VAULT_TRANSIT_KEY_NAME and VAULT_TRANSIT_POLICY_NAME are required when VAULT_TRANSIT_ENGINE_NAME is set"
+            )
         client = VaultClient(self.url, self.token)
         client.create_secret_engine(self.secret_engine_name, "kv")
         client.create_policy(self.policy_name, self.get_policy())
+        policy_names = [self.policy_name]
+        if self.transit_engine_name:
+            client.create_secret_engine(self.transit_engine_name, "transit")
+            client.create_transit_key(self.transit_key_name, self.transit_engine_name)
+            client.create_policy(self.transit_policy_name, self.get_transit_policy())
+            policy_names.append(self.transit_policy_name)
         client.create_auth_method(self.auth_method_name)
         client.create_user(
-            self.user_name, self.password, self.policy_name, self.auth_method_name
+            self.user_name, self.password, policy_names, self.auth_method_name
         )
+        if self.transit_engine_name:
+            # An existing user keeps its old policies, attach the transit policy to it
+            client.update_user_policies(
+                self.user_name, policy_names, self.auth_method_name
+            )
 
     def get_policy(self):
         """
@@ -185,6 +238,22 @@ class VaultConfig:
                 }}
                 """
 
+    def get_transit_policy(self):
+        """
+        Returns a Vault Policy with permissions to encrypt, decrypt and generate data keys with the transit key
+        """
+        return f"""
+                path "{self.transit_engine_name}/encrypt/{self.transit_key_name}" {{
+                capabilities = ["update"]
+                }}
+                path "{self.transit_engine_name}/decrypt/{self.transit_key_name}" {{
+                capabilities = ["update"]
+                }}
+                path "{self.transit_engine_name}/datakey/plaintext/{self.transit_key_name}" {{
+                capabilities = ["update"]
+                }}
+                """
+
 
 if __name__ == "__main__":
     config = VaultConfig(
@@ -196,6 +265,9 @@ if __name__ == "__main__":
         auth_method_name=os.environ.get("VAULT_AUTH_METHOD_NAME", ""),
         user_name=os.environ.get("VAULT_USER_NAME", ""),
         password=os.environ.get("VAULT_USER_PASSWORD", ""),
+        transit_engine_name=os.environ.get("VAULT_TRANSIT_ENGINE_NAME", ""),
+        transit_key_name=os.environ.get("VAULT_TRANSIT_KEY_NAME", ""),
+        transit_policy_name=os.environ.get("VAULT_TRANSIT_POLICY_NAME", ""),
     )
     config.initialize_and_unseal_vault()
     config.configure_vault()